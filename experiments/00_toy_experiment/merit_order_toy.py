@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 import os
 
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-from matplotlib.ticker import MaxNLocator, StrMethodFormatter
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from matplotlib.ticker import MaxNLocator, StrMethodFormatter  # noqa: E402
 
 BASE_LOAD_MW = 12000
 PEAK_LOAD_MW = 19000
@@ -17,7 +21,7 @@ ANNOTATION_BOX = dict(
 )
 
 
-def build_toy_fleet() -> pd.DataFrame:
+def build_toy_fleet() -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
     data = [
         {
             "technology": "Solar/Wind",
@@ -59,7 +63,25 @@ def build_toy_fleet() -> pd.DataFrame:
     df = pd.DataFrame(data)
     df["cum_capacity_mw"] = df["capacity_mw"].cumsum()
     df["start_capacity_mw"] = df["cum_capacity_mw"] - df["capacity_mw"]
-    return df
+    edges = np.concatenate(([0], df["cum_capacity_mw"].to_numpy()))
+    prices = df["marginal_cost"].to_numpy()
+    return df, edges, prices
+
+
+def price_at_vec(
+    demands_mw: np.ndarray,
+    edges_mw: np.ndarray,
+    prices: np.ndarray,
+    *,
+    boundary: str = "right",
+    bin_size_mw: int | None = None,
+) -> np.ndarray:
+    demands = np.asarray(demands_mw, dtype=float)
+    if bin_size_mw:
+        demands = np.floor_divide(demands, bin_size_mw) * bin_size_mw
+    idx = np.searchsorted(edges_mw, demands, side=boundary) - 1
+    np.clip(idx, 0, len(prices) - 1, out=idx)
+    return prices[idx]
 
 
 def price_at(
@@ -70,63 +92,63 @@ def price_at(
     boundary: str = "right",
     bin_size_mw: int | None = None,
 ) -> float:
-    demand = float(demand_mw)
-    if bin_size_mw:
-        demand = (demand // bin_size_mw) * bin_size_mw
-    idx = np.searchsorted(edges_mw, demand, side=boundary) - 1
-    idx = int(np.clip(idx, 0, len(prices) - 1))
-    return float(prices[idx])
+    demands = np.array([demand_mw], dtype=float)
+    return float(
+        price_at_vec(demands, edges_mw, prices, boundary=boundary, bin_size_mw=bin_size_mw)[0]
+    )
 
 
-def step_arrays(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    edges = np.concatenate(([0], df["cum_capacity_mw"].to_numpy()))
-    prices = df["marginal_cost"].to_numpy()
+def step_arrays(edges: np.ndarray, prices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     x_step = edges
-    y_step = np.concatenate((prices, [prices[-1]]))
-    return edges, prices, x_step, y_step
+    y_step = np.append(prices, prices[-1])
+    return x_step, y_step
 
 
-def plot_merit_order(df: pd.DataFrame, output_path: str) -> None:
+def plot_merit_order(
+    df: pd.DataFrame,
+    edges: np.ndarray,
+    prices: np.ndarray,
+    output_path: str,
+) -> None:
     total_capacity = int(df["capacity_mw"].sum())
     max_price = float(df["marginal_cost"].max())
 
-    edges, prices, x_step, y_step = step_arrays(df)
+    x_step, y_step = step_arrays(edges, prices)
 
     fig, ax = plt.subplots(figsize=(11, 6.5))
     fig.patch.set_facecolor("white")
     ax.set_facecolor("#f7f5f0")
     ax.set_axisbelow(True)
 
-    for _, row in df.iterrows():
-        start = float(row["start_capacity_mw"])
-        end = float(row["cum_capacity_mw"])
-        price = float(row["marginal_cost"])
+    label_offset = max(5.0, max_price * 0.02)
+    for start, end, price, color, technology in zip(
+        df["start_capacity_mw"].to_numpy(dtype=float),
+        df["cum_capacity_mw"].to_numpy(dtype=float),
+        df["marginal_cost"].to_numpy(dtype=float),
+        df["color"].to_numpy(),
+        df["technology"].to_numpy(),
+    ):
         ax.fill_between(
             [start, end],
             0,
             price,
-            color=row["color"],
+            color=color,
             alpha=0.5,
         )
-
-    ax.step(x_step, y_step, where="post", color="black", linewidth=2)
-
-    label_offset = max(5.0, max_price * 0.02)
-    for _, row in df.iterrows():
-        start = float(row["start_capacity_mw"])
-        end = float(row["cum_capacity_mw"])
-        mid = (start + end) / 2
         ax.text(
-            mid,
-            row["marginal_cost"] + label_offset,
-            row["technology"],
+            (start + end) / 2,
+            price + label_offset,
+            technology,
             ha="center",
             va="bottom",
             fontsize=9,
         )
 
-    base_price = price_at(BASE_LOAD_MW, edges, prices, boundary="right")
-    peak_price = price_at(PEAK_LOAD_MW, edges, prices, boundary="right")
+    ax.step(x_step, y_step, where="post", color="black", linewidth=2)
+
+    base_price, peak_price = price_at_vec(
+        np.array([BASE_LOAD_MW, PEAK_LOAD_MW]), edges, prices, boundary="right"
+    )
 
     ax.axvline(BASE_LOAD_MW, color="#5c677d", linestyle="--", linewidth=1)
     ax.axvline(PEAK_LOAD_MW, color="#5c677d", linestyle="--", linewidth=1)
@@ -197,28 +219,27 @@ def plot_merit_order(df: pd.DataFrame, output_path: str) -> None:
 
 
 def main() -> None:
-    df = build_toy_fleet()
+    df, edges, prices = build_toy_fleet()
 
     total_capacity = int(df["capacity_mw"].sum())
     max_price = int(df["marginal_cost"].max())
     assert total_capacity == 21000
     assert max_price == 300
 
-    edges, prices, _, _ = step_arrays(df)
-
     # Use coarse 1,000 MW blocks to emphasize the discrete toy cliff in assertions.
-    price_at_18999 = price_at(
-        18999, edges, prices, boundary="left", bin_size_mw=CLIFF_CHECK_BLOCK_MW
-    )
-    price_at_19001 = price_at(
-        19001, edges, prices, boundary="left", bin_size_mw=CLIFF_CHECK_BLOCK_MW
+    price_at_18999, price_at_19001 = price_at_vec(
+        np.array([18999, 19001]),
+        edges,
+        prices,
+        boundary="left",
+        bin_size_mw=CLIFF_CHECK_BLOCK_MW,
     )
     assert price_at_19001 > (price_at_18999 * 1.5), (
         "Error: The Price Cliff is missing or too small."
     )
 
     output_path = "merit_order_toy_viz.png"
-    plot_merit_order(df, output_path)
+    plot_merit_order(df, edges, prices, output_path)
     assert os.path.exists(output_path)
     print("SUCCESS: Logic verified and visualization saved")
 
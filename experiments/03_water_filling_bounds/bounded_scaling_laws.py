@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 import os
+import sys
 
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.optimize import brentq, curve_fit
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from experiments._water_filling import (  # noqa: E402
+    generate_duck_curve,
+    solve_ceiling_analytic,
+)
 
-HOURS_PER_DAY = 24.0
 NUM_POINTS = 1000
 CAPACITY_MIN_MWH = 100.0
 CAPACITY_MAX_MWH = 50000.0
@@ -13,83 +23,54 @@ LOGSPACE_POINTS = 50
 BLOCK_START_HOUR = 17.0
 BLOCK_DURATION_HOURS = 4.0
 EFFECTIVE_CAPACITY_FACTOR = 0.75
+# Phase shift to align the peak window with early evening hours.
+DUCK_PHASE_HOURS = -12.0
+FIT_LOWER_BOUNDS = np.array([0.0, 0.0])
+FIT_MAX_ITERATIONS = 100
+FIT_RTOL = 1e-10
+FIT_MIN_STEP_FRACTION = 1e-10
 OUTPUT_PATH = "bounded_scaling_viz.png"
 
 
-def generate_duck_curve(num_points: int = NUM_POINTS) -> tuple[np.ndarray, np.ndarray]:
-    time_hours = np.linspace(0.0, HOURS_PER_DAY, num_points, endpoint=False)
-    # Phase shift to align the peak window with early evening hours.
-    time_rad = 2 * np.pi * (time_hours - 12.0) / HOURS_PER_DAY
-    load_mw = 12000 + 6000 * np.sin(time_rad) - 4000 * np.cos(2 * time_rad)
-    load_mw = np.clip(load_mw, 0.0, None)
-    return time_hours, load_mw
-
-
-def solve_optimal_ceiling(
-    load_curve: np.ndarray,
-    capacity_mwh: float,
-    dt_hours: float,
-) -> float:
-    loads = np.asarray(load_curve, dtype=float)
-    max_load = float(loads.max())
-    min_load = float(loads.min())
-
-    if capacity_mwh <= 0:
-        return max_load
-
-    def energy_above(level: float) -> float:
-        return float(np.maximum(loads - level, 0.0).sum() * dt_hours)
-
-    def residual(level: float) -> float:
-        return energy_above(level) - capacity_mwh
-
-    low = min_load
-    high = max_load
-    if residual(low) < 0:
-        total_energy = float(loads.sum() * dt_hours)
-        total_time = float(len(loads) * dt_hours)
-        low = (total_energy - capacity_mwh) / total_time
-        if residual(low) < 0:
-            low -= abs(low) * 1e-6 + 1e-6
-
-    return float(brentq(residual, low, high))
-
-
-def simulate_bounds(load_curve: np.ndarray, capacity_mwh: float) -> tuple[float, float, float]:
-    dt_hours = HOURS_PER_DAY / len(load_curve)
-    peak_opt = solve_optimal_ceiling(load_curve, capacity_mwh, dt_hours)
-
-    discharge_power = capacity_mwh / BLOCK_DURATION_HOURS
-    time_hours = np.linspace(0.0, HOURS_PER_DAY, len(load_curve), endpoint=False)
-    block_end_hour = BLOCK_START_HOUR + BLOCK_DURATION_HOURS
-    block_mask = (time_hours >= BLOCK_START_HOUR) & (time_hours < block_end_hour)
-    pess_curve = load_curve.copy()
-    pess_curve[block_mask] = pess_curve[block_mask] - discharge_power
-    peak_pess = float(pess_curve.max())
-
-    effective_capacity = capacity_mwh * EFFECTIVE_CAPACITY_FACTOR
-    peak_exp = solve_optimal_ceiling(load_curve, effective_capacity, dt_hours)
-    return peak_opt, peak_pess, peak_exp
-
-
 def power_law(x: np.ndarray, a: float, alpha: float) -> np.ndarray:
     return a * np.power(x, -alpha)
 
 
 def fit_power_law(capacities: np.ndarray, peaks: np.ndarray) -> tuple[float, float]:
     log_x = np.log(capacities)
-    log_y = np.log(peaks)
-    slope, intercept = np.polyfit(log_x, log_y, 1)
-    alpha_guess = -slope
-    a_guess = np.exp(intercept)
-    params, _ = curve_fit(
-        power_law,
-        capacities,
-        peaks,
-        p0=(a_guess, alpha_guess),
-        bounds=(0, np.inf),
-        maxfev=10000,
-    )
+    slope, intercept = np.polyfit(log_x, np.log(peaks), 1)
+    params = np.maximum(np.array([np.exp(intercept), -slope]), FIT_LOWER_BOUNDS)
+    sse = float(np.sum((peaks - power_law(capacities, *params)) ** 2))
+
+    # Damped Gauss-Newton on the linear-space residuals with a, alpha >= 0. A
+    # parameter sitting on its bound is held there while descent points out of it.
+    for _ in range(FIT_MAX_ITERATIONS):
+        a, alpha = params
+        basis = np.power(capacities, -alpha)
+        residual = peaks - power_law(capacities, *params)
+        jacobian = np.column_stack((basis, -a * basis * log_x))
+        descent = jacobian.T @ residual
+        free = ~((params <= FIT_LOWER_BOUNDS) & (descent < 0))
+        step = np.zeros_like(params)
+        step[free], *_ = np.linalg.lstsq(jacobian[:, free], residual, rcond=None)
+
+        fraction = 1.0
+        while True:
+            candidate = np.maximum(params + fraction * step, FIT_LOWER_BOUNDS)
+            candidate_sse = float(np.sum((peaks - power_law(capacities, *candidate)) ** 2))
+            if candidate_sse <= sse:
+                break
+            fraction *= 0.5
+            if fraction < FIT_MIN_STEP_FRACTION:
+                raise RuntimeError("Power-law fit stalled: no step reduces the squared error.")
+
+        converged = np.all(np.abs(candidate - params) <= FIT_RTOL * np.abs(candidate))
+        params, sse = candidate, candidate_sse
+        if converged:
+            break
+    else:
+        raise RuntimeError(f"Power-law fit did not converge within {FIT_MAX_ITERATIONS} iterations.")
+
     return float(params[0]), float(params[1])
 
 
@@ -155,7 +136,11 @@ def plot_safety_corridor(
 
 
 def main() -> None:
-    _, load_curve = generate_duck_curve()
+    time_hours, load_curve = generate_duck_curve(NUM_POINTS, DUCK_PHASE_HOURS)
+    block_end_hour = BLOCK_START_HOUR + BLOCK_DURATION_HOURS
+    block_mask = (time_hours >= BLOCK_START_HOUR) & (time_hours < block_end_hour)
+    block_peak_mw = float(load_curve[block_mask].max())
+    off_block_peak_mw = float(load_curve[~block_mask].max())
 
     capacities = np.logspace(
         np.log10(CAPACITY_MIN_MWH),
@@ -163,18 +148,11 @@ def main() -> None:
         LOGSPACE_POINTS,
     )
 
-    peaks_opt = []
-    peaks_pess = []
-    peaks_exp = []
-    for capacity in capacities:
-        peak_opt, peak_pess, peak_exp = simulate_bounds(load_curve, capacity)
-        peaks_opt.append(peak_opt)
-        peaks_pess.append(peak_pess)
-        peaks_exp.append(peak_exp)
-
-    peaks_opt = np.array(peaks_opt)
-    peaks_pess = np.array(peaks_pess)
-    peaks_exp = np.array(peaks_exp)
+    # One vectorized solve covers the nameplate and effective capacities together.
+    ceilings = solve_ceiling_analytic(np.concatenate((capacities, EFFECTIVE_CAPACITY_FACTOR * capacities)))
+    peaks_opt, peaks_exp = np.split(ceilings, 2)
+    # A constant block discharge only shifts the in-window peak down.
+    peaks_pess = np.maximum(off_block_peak_mw, block_peak_mw - capacities / BLOCK_DURATION_HOURS)
 
     if not np.all((peaks_opt <= peaks_exp + 1e-8) & (peaks_exp <= peaks_pess + 1e-8)):
         raise ValueError("Self-check failed: expected bound not between optimistic and pessimistic bounds.")
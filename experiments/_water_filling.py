@@ -0,0 +1,139 @@
+import numpy as np
+
+HOURS_PER_DAY = 24.0
+DUCK_MEAN_MW = 12000.0
+DUCK_DAILY_AMPLITUDE_MW = 6000.0
+DUCK_TWICE_DAILY_AMPLITUDE_MW = 4000.0
+ANALYTIC_MAX_ITERATIONS = 50
+ANALYTIC_RTOL = 1e-9
+ANALYTIC_ENERGY_ATOL_MWH = 1e-9
+ANALYTIC_BISECTION_ITERATIONS = 100
+
+
+def generate_duck_curve(num_points: int, phase_hours: float) -> tuple[np.ndarray, np.ndarray]:
+    time_hours = np.linspace(0.0, HOURS_PER_DAY, num_points, endpoint=False)
+    phase_rad = 2 * np.pi * phase_hours / HOURS_PER_DAY
+    time_rad = np.linspace(phase_rad, phase_rad + 2 * np.pi, num_points, endpoint=False)
+    load_mw = (
+        DUCK_MEAN_MW
+        + DUCK_DAILY_AMPLITUDE_MW * np.sin(time_rad)
+        - DUCK_TWICE_DAILY_AMPLITUDE_MW * np.cos(2 * time_rad)
+    )
+    np.clip(load_mw, 0.0, None, out=load_mw)
+    return time_hours, load_mw
+
+
+def batch_solve_ceilings(
+    loads: np.ndarray,
+    capacities_mwh: np.ndarray,
+    dt_hours: float,
+) -> np.ndarray:
+    sorted_loads = np.sort(loads)
+
+    # Energy above each sorted load; it is linear in the ceiling between breakpoints.
+    prefix_sums = np.concatenate(([0.0], np.cumsum(sorted_loads)))
+    tail_sums = prefix_sums[-1] - prefix_sums[:-1]
+    tail_counts = np.arange(len(sorted_loads), 0, -1)
+    energy_above = (tail_sums - tail_counts * sorted_loads) * dt_hours
+
+    # First breakpoint whose energy drops to each capacity. k == 0 means the
+    # ceiling sits below the minimum load, where every point is shaved.
+    k = np.searchsorted(-energy_above, -capacities_mwh)
+    k = np.minimum(k, len(sorted_loads) - 1)
+    ceilings = (tail_sums[k] - capacities_mwh / dt_hours) / tail_counts[k]
+    return np.where(capacities_mwh > 0, ceilings, sorted_loads[-1])
+
+
+def solve_optimal_ceiling(
+    loads: np.ndarray,
+    capacity_mwh: float,
+    dt_hours: float,
+) -> float:
+    return float(batch_solve_ceilings(loads, np.array([capacity_mwh]), dt_hours)[0])
+
+
+def _above_level_arcs(level: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # With u = sin(theta) the duck curve is the parabola 2C u^2 + B u + (A - C).
+    # C > 0 makes it convex, so it sits above the level for u below the low
+    # root or above the high root.
+    curvature = 2 * DUCK_TWICE_DAILY_AMPLITUDE_MW
+    vertex = -DUCK_DAILY_AMPLITUDE_MW / (2 * curvature)
+    discriminant = DUCK_DAILY_AMPLITUDE_MW**2 - 4 * curvature * (
+        DUCK_MEAN_MW - DUCK_TWICE_DAILY_AMPLITUDE_MW - level
+    )
+    half_width = np.sqrt(np.maximum(discriminant, 0.0)) / (2 * curvature)
+    theta_low = np.arcsin(np.clip(vertex - half_width, -1.0, 1.0))
+    theta_high = np.arcsin(np.clip(vertex + half_width, -1.0, 1.0))
+    return theta_low, theta_high
+
+
+def energy_above_analytic(level: np.ndarray) -> np.ndarray:
+    theta_low, theta_high = _above_level_arcs(level)
+
+    def antiderivative(theta: np.ndarray) -> np.ndarray:
+        return (
+            (DUCK_MEAN_MW - level) * theta
+            - DUCK_DAILY_AMPLITUDE_MW * np.cos(theta)
+            - 0.5 * DUCK_TWICE_DAILY_AMPLITUDE_MW * np.sin(2 * theta)
+        )
+
+    # Over a full period the phase drops out; integrate the two above-level arcs exactly.
+    integral = (
+        antiderivative(np.pi - theta_high)
+        - antiderivative(theta_high)
+        + antiderivative(2 * np.pi + theta_low)
+        - antiderivative(np.pi - theta_low)
+    )
+    return integral * HOURS_PER_DAY / (2 * np.pi)
+
+
+def solve_ceiling_analytic(capacities_mwh: np.ndarray) -> np.ndarray:
+    peak = DUCK_MEAN_MW + abs(DUCK_DAILY_AMPLITUDE_MW) + DUCK_TWICE_DAILY_AMPLITUDE_MW
+    ceilings = np.full_like(capacities_mwh, peak, dtype=float)
+    positive = capacities_mwh > 0
+    capacities = capacities_mwh[positive]
+
+    # The energy above a ceiling is convex and decreasing, so Newton's method from
+    # the shave-everything ceiling climbs monotonically onto the root. The energy
+    # is a difference of ~1e5 antiderivative terms, so the stopping test allows
+    # an absolute floor the arithmetic can actually reach.
+    floor = DUCK_MEAN_MW - capacities / HOURS_PER_DAY
+    level = floor.copy()
+    tolerance = ANALYTIC_RTOL * capacities + ANALYTIC_ENERGY_ATOL_MWH
+    for _ in range(ANALYTIC_MAX_ITERATIONS):
+        residual = energy_above_analytic(level) - capacities
+        converged = np.abs(residual) <= tolerance
+        if np.all(converged):
+            break
+        theta_low, theta_high = _above_level_arcs(level)
+        hours_above = (np.pi + theta_low - theta_high) * HOURS_PER_DAY / np.pi
+        active = ~converged & (hours_above > 0)
+        if not np.any(active):
+            break
+        level[active] = np.minimum(level[active] + residual[active] / hours_above[active], peak)
+
+    # Tiny capacities sit where the rounding noise in the energy exceeds the
+    # tolerance; bisect those on the bracket [shave-everything ceiling, peak].
+    stalled = ~converged
+    if np.any(stalled):
+        low = floor[stalled]
+        high = np.full_like(low, peak)
+        target = capacities[stalled]
+        for _ in range(ANALYTIC_BISECTION_ITERATIONS):
+            mid = 0.5 * (low + high)
+            above = energy_above_analytic(mid) > target
+            low = np.where(above, mid, low)
+            high = np.where(above, high, mid)
+        level[stalled] = 0.5 * (low + high)
+
+    ceilings[positive] = level
+    return ceilings
+
+
+def apply_reverse_water_filling(
+    load_curve: np.ndarray,
+    capacity_mwh: float,
+    dt_hours: float,
+) -> tuple[float, np.ndarray]:
+    ceiling = solve_optimal_ceiling(load_curve, capacity_mwh, dt_hours)
+    return ceiling, np.minimum(load_curve, ceiling)